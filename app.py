@@ -2,6 +2,7 @@ import os
 import base64
 import streamlit as st
 import pandas as pd
+import numpy as np
 import snowflake.connector
 from groq import Groq
 import random
@@ -12,6 +13,10 @@ import secrets
 import re
 from PIL import Image
 import json
+import io
+import threading
+from collections import OrderedDict
+import qrcode
 
 # ---------------------------
 # AI CLIENT
@@ -258,6 +263,36 @@ ORDER BY timestamp DESC
         cur.close()
         conn.close()
 
+def load_receipts_since(since=None):
+    """Receipts recorded after `since` (all of them if None), oldest first.
+
+    Returns (df, from_snowflake) so callers know whether the rows are shared or per-session.
+    """
+    columns = ["order_id","items","pickup_dt","timestamp"]
+    conn = get_connection()
+    if not conn:
+        _ensure_local_db()
+        rows = [
+            {"order_id": r["order_id"], "items": r["items"], "pickup_dt": r["pickup_time"], "timestamp": r["timestamp"]}
+            for r in st.session_state._local_receipts
+            if since is None or r["timestamp"] > since
+        ]
+        return pd.DataFrame(rows, columns=columns), False
+    try:
+        cur = conn.cursor()
+        if since is None:
+            cur.execute("SELECT order_id, items, pickup_time AS pickup_dt, timestamp FROM receipts ORDER BY timestamp")
+        else:
+            cur.execute(
+                "SELECT order_id, items, pickup_time AS pickup_dt, timestamp FROM receipts WHERE timestamp > %s ORDER BY timestamp",
+                (since,)
+            )
+        rows = cur.fetchall()
+        return pd.DataFrame(rows, columns=columns), True
+    finally:
+        cur.close()
+        conn.close()
+
 # ---------------------------
 # FEEDBACK
 # ---------------------------
@@ -347,6 +382,202 @@ def upsert_menu(df: pd.DataFrame):
         cur.close()
         conn.close()
 
+# ---------------------------
+# DEMAND FORECASTING
+# ---------------------------
+# Seasonal model: expected qty per item for each (day-of-week, hour) slot,
+# i.e. total qty sold in that slot / number of such hours observed.
+# Only running sums are kept, so a refit just folds in receipts past the watermark.
+# Fitted models are never mutated: a refit builds a new dict and swaps it into the cache.
+WEEK_SLOTS = 7 * 24
+MAX_CACHED_MODELS = 4
+# Refits re-read this much before the watermark so receipts committed late (or sharing
+# the watermark's timestamp) are still picked up; ids seen in the window are skipped.
+REFIT_OVERLAP = pd.Timedelta(minutes=10)
+
+def _parse_order_items(raw) -> dict:
+    items = raw
+    # items may be JSON-encoded twice (save_receipt dumps an already-dumped string)
+    while isinstance(items, str):
+        try:
+            items = json.loads(items)
+        except ValueError:
+            return {}
+    if not isinstance(items, dict):
+        return {}
+    return {k: (v.get("qty", 0) if isinstance(v, dict) else v) for k, v in items.items()}
+
+def _slot_index(hours: pd.DatetimeIndex) -> np.ndarray:
+    return np.asarray(hours.dayofweek * 24 + hours.hour)
+
+def _count_slot_hours(start, end) -> np.ndarray:
+    """How many times each weekly slot occurs in the hours [start, end)."""
+    if start is None or end is None or end <= start:
+        return np.zeros(WEEK_SLOTS)
+    hours = pd.date_range(start, end, freq="h", inclusive="left")
+    return np.bincount(_slot_index(hours), minlength=WEEK_SLOTS).astype(float)
+
+def build_hourly_demand(receipts: pd.DataFrame) -> pd.DataFrame:
+    """Hour x item matrix of quantities ordered, bucketed by pickup hour."""
+    if receipts.empty:
+        return pd.DataFrame(index=pd.DatetimeIndex([], name="hour"))
+    lines = pd.DataFrame({
+        "hour": pd.to_datetime(receipts["pickup_dt"], errors="coerce").dt.floor("h"),
+        "items": receipts["items"].map(lambda raw: list(_parse_order_items(raw).items())),
+    }).explode("items").dropna()
+    if lines.empty:
+        return pd.DataFrame(index=pd.DatetimeIndex([], name="hour"))
+    lines[["item", "qty"]] = pd.DataFrame(lines["items"].tolist(), index=lines.index)
+    lines["qty"] = pd.to_numeric(lines["qty"], errors="coerce").fillna(0)
+    return lines.pivot_table(index="hour", columns="item", values="qty", aggfunc="sum", fill_value=0)
+
+def update_demand_model(model: dict | None, new_receipts: pd.DataFrame, now: datetime) -> dict:
+    """Return a new model with `new_receipts` folded in; `model` itself is left untouched."""
+    if model is None:
+        model = {
+            "sums": pd.DataFrame(index=range(WEEK_SLOTS)),
+            "slot_hours": np.zeros(WEEK_SLOTS),
+            "start": None,
+            "end": None,
+            "watermark": None,
+            "recent_ids": {},
+        }
+    model = dict(model)
+    recent_ids = dict(model["recent_ids"])
+    if not new_receipts.empty:
+        new_receipts = new_receipts[~new_receipts["order_id"].isin(list(recent_ids))]
+    hourly = build_hourly_demand(new_receipts)
+    start, end = model["start"], model["end"]
+    new_end = pd.Timestamp(now).floor("h")
+    if not hourly.empty:
+        slot_sums = hourly.groupby(_slot_index(hourly.index)).sum().reindex(range(WEEK_SLOTS), fill_value=0)
+        model["sums"] = model["sums"].add(slot_sums, fill_value=0).fillna(0)
+        first, last = hourly.index.min(), hourly.index.max() + pd.Timedelta(hours=1)
+        start = first if start is None else min(start, first)
+        new_end = max(new_end, last)
+    if start is not None:
+        if model["start"] is None:
+            model["slot_hours"] = _count_slot_hours(start, new_end)
+            end = new_end
+        else:
+            model["slot_hours"] = model["slot_hours"] + _count_slot_hours(start, model["start"])
+            if new_end > end:
+                model["slot_hours"] = model["slot_hours"] + _count_slot_hours(end, new_end)
+                end = new_end
+    model["start"], model["end"] = start, end
+    if not new_receipts.empty:
+        stamps = pd.to_datetime(new_receipts["timestamp"])
+        recent_ids.update(zip(new_receipts["order_id"], stamps))
+        latest = stamps.max()
+        if pd.notna(latest):
+            model["watermark"] = latest.to_pydatetime()
+    if model["watermark"] is not None:
+        cutoff = pd.Timestamp(model["watermark"]) - REFIT_OVERLAP
+        recent_ids = {oid: ts for oid, ts in recent_ids.items() if ts >= cutoff}
+    model["recent_ids"] = recent_ids
+    return model
+
+def forecast_demand(model: dict, now: datetime, hours: int, items=None) -> pd.DataFrame:
+    """Expected qty per item for each of the next `hours` hours, starting with the current one."""
+    index = pd.date_range(pd.Timestamp(now).floor("h"), periods=hours, freq="h", name="hour")
+    sums = model["sums"]
+    if items is not None:
+        sums = sums.reindex(columns=list(items), fill_value=0)
+    slot_hours = model["slot_hours"]
+    rates = sums.div(np.where(slot_hours > 0, slot_hours, 1), axis=0)
+    forecast = rates.reindex(_slot_index(index), fill_value=0)
+    forecast.index = index
+    return forecast
+
+def menu_version(menu_df: pd.DataFrame) -> str:
+    # Only the item set matters to the model; price edits must not force a full refit.
+    snapshot = menu_df[["CATEGORY", "ITEM"]].drop_duplicates().sort_values(["CATEGORY", "ITEM"]).to_csv(index=False)
+    return hashlib.sha256(snapshot.encode()).hexdigest()[:16]
+
+@st.cache_resource
+def _demand_models() -> tuple[dict, threading.Lock]:
+    return {}, threading.Lock()
+
+def _local_demand_models() -> tuple[dict, threading.Lock]:
+    # Local receipts live in session_state, so their models must not be shared across sessions.
+    if "_local_demand_models" not in st.session_state:
+        st.session_state._local_demand_models = ({}, threading.Lock())
+    return st.session_state._local_demand_models
+
+def _snowflake_configured() -> bool:
+    try:
+        return all(k in st.secrets for k in ("SNOWFLAKE_USER", "SNOWFLAKE_PASSWORD", "SNOWFLAKE_ACCOUNT"))
+    except Exception:
+        return False
+
+def get_demand_model(menu_df: pd.DataFrame) -> dict:
+    shared = _snowflake_configured()
+    models, lock = _demand_models() if shared else _local_demand_models()
+    version = menu_version(menu_df)
+    with lock:
+        cached = models.get(version)
+        # The sums don't depend on the menu, so a new version starts from the latest model.
+        base = cached if cached is not None else next(reversed(models.values()), None)
+    since = None
+    if base is not None and base["watermark"] is not None:
+        since = (pd.Timestamp(base["watermark"]) - REFIT_OVERLAP).to_pydatetime()
+    receipts, from_snowflake = load_receipts_since(since)
+    if from_snowflake != shared:
+        # Snowflake is configured but unreachable: serve what we have, cache nothing.
+        return base if base is not None else update_demand_model(None, receipts, datetime.now())
+    model = update_demand_model(base, receipts, datetime.now())
+    with lock:
+        # Another session may have refitted meanwhile; its model is just as valid, keep it.
+        if models.get(version) is cached:
+            models.pop(version, None)
+            models[version] = model
+            while len(models) > MAX_CACHED_MODELS:
+                models.pop(next(iter(models)))
+    return model
+
+# ---------------------------
+# PAYMENT QR
+# ---------------------------
+QR_CACHE_SIZE = 256
+
+try:
+    GCASH_MERCHANT_REF = st.secrets["GCASH_MERCHANT_REF"]
+except Exception:
+    GCASH_MERCHANT_REF = "BITEHUB"
+
+@st.cache_resource
+def _qr_cache() -> tuple[OrderedDict, threading.Lock]:
+    # Shared across reruns and sessions; the script body re-executes on every rerun.
+    return OrderedDict(), threading.Lock()
+
+def _make_qr_png(payload: str) -> bytes:
+    img = qrcode.make(payload, box_size=6, border=2)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+def get_payment_qr(order_id: str, amount: float) -> bytes:
+    """PNG bytes of the GCash QR for an order, kept in a bounded LRU keyed by order ID and amount."""
+    amount = round(float(amount), 2)
+    key = (order_id, amount)
+    cache, lock = _qr_cache()
+    with lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+    payload = json.dumps({
+        "order_id": order_id,
+        "amount": f"{amount:.2f}",
+        "merchant_ref": GCASH_MERCHANT_REF,
+    })
+    png = _make_qr_png(payload)
+    with lock:
+        cache[key] = png
+        cache.move_to_end(key)
+        while len(cache) > QR_CACHE_SIZE:
+            cache.popitem(last=False)
+    return png
+
 # ---------------------------
 # AI
 # ---------------------------
@@ -474,7 +705,24 @@ elif st.session_state.page == "main":
 
         if choice == "Dashboard":
             st.subheader("📊 Staff Dashboard")
-            st.info("Metrics and KPIs coming soon.")
+            st.markdown("### 🍳 Prep Plan")
+            horizon = st.slider("Plan for the next N hours", 1, 24, 6, key="prep_horizon")
+            menu_df = load_menu()
+            if not menu_df.empty:
+                model = get_demand_model(menu_df)
+                forecast = forecast_demand(model, datetime.now(), horizon, items=menu_df["ITEM"].unique())
+                plan = forecast.sum().round().astype(int)
+                plan = plan[plan > 0].sort_values(ascending=False)
+                if not plan.empty:
+                    st.dataframe(
+                        plan.rename_axis("Item").reset_index(name="Qty to Prep"),
+                        use_container_width=True
+                    )
+                    st.bar_chart(forecast[plan.index].round(1))
+                else:
+                    st.info("Not enough order history to plan prep yet.")
+            else:
+                st.info("No menu items available.")
 
         elif choice == "Pending Orders":
             st.subheader("📦 Pending Orders")
@@ -656,7 +904,7 @@ if st.session_state.page == "payment":
             st.rerun()
 
         elif method == "GCash":
-            st.image("https://via.placeholder.com/150?text=GCash+QR", caption="Scan QR to Pay")
+            st.image(get_payment_qr(pending["order_id"], total_cost), caption="Scan QR to Pay", width=150)
             if st.button("Simulate GCash Payment Success"):
                 save_receipt(**pending)
                 st.success(f"✅ Order confirmed! Order ID: {pending['order_id']}")